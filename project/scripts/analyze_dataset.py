@@ -1,5 +1,7 @@
-import pandas as pd
 import os
+import sys
+
+from nga_data import SCHEMAS, artist_rows, load_table
 
 # Пути к данным
 images_path = "./3rd_party/opendata/data/published_images.csv"
@@ -9,44 +11,47 @@ objects_path = "./3rd_party/opendata/data/objects.csv"
 
 # Загрузка данных
 print("Загрузка данных...")
-images = pd.read_csv(images_path)
-constituents = pd.read_csv(constituents_path)
-objects_constituents = pd.read_csv(objects_constituents_path)
-objects = pd.read_csv(objects_path)
+images = load_table(images_path, **SCHEMAS["images"])
+constituents = load_table(constituents_path, **SCHEMAS["constituents"])
+objects_constituents = load_table(objects_constituents_path, **SCHEMAS["objects_constituents"])
+objects = load_table(objects_path, **SCHEMAS["objects"])
 
 # Получаем список скачанных файлов
 dataset_dir = "./NGA_Dataset"
-downloaded_files = [f for f in os.listdir(dataset_dir) if f.endswith('.jpg')]
-downloaded_uuids = [f.replace('.jpg', '') for f in downloaded_files]
+downloaded_uuids = {e.name[:-4] for e in os.scandir(dataset_dir) if e.name.endswith('.jpg')}
 
-print(f"\nВсего скачано изображений: {len(downloaded_files)}")
+print(f"\nВсего скачано изображений: {len(downloaded_uuids)}")
 
 # Фильтруем images по скачанным uuid
 downloaded_images = images[images['uuid'].isin(downloaded_uuids)]
 
 # Получаем объекты
-object_ids = downloaded_images['depictstmsobjectid'].unique()
-downloaded_objects = objects[objects['objectid'].isin(object_ids)]
-
-# Получаем авторов
-authors_relations = objects_constituents[
-    (objects_constituents['objectid'].isin(object_ids)) &
-    (objects_constituents['roletype'] == 'artist')
+object_ids = frozenset(downloaded_images['depictstmsobjectid'].dropna().tolist())
+downloaded_objects = objects.loc[
+    objects['objectid'].isin(object_ids), ['objectid', 'title', 'displaydate']
 ]
 
-# Объединяем с данными об авторах
-authors_info = authors_relations.merge(
-    constituents[['constituentid', 'preferreddisplayname']], 
-    on='constituentid'
-)
-
-# Объединяем с объектами для получения полной информации
-full_info = authors_info.merge(
-    downloaded_objects[['objectid', 'title', 'displaydate']], 
-    on='objectid'
-)
-
-# Объединяем с изображениями для получения uuid
+# Получаем авторов
+authors_relations = artist_rows(objects_constituents)
+authors_relations = authors_relations[authors_relations['objectid'].isin(object_ids)]
+
+# Справочники по ключам: имя автора и данные объекта
+name_by_cid = constituents.loc[
+    constituents['constituentid'].isin(authors_relations['constituentid'])
+].set_index('constituentid')['preferreddisplayname']
+objects_by_oid = downloaded_objects.set_index('objectid')
+
+# Добавляем имя автора, название и дату одним проходом
+# (astype сохраняет строковый тип, даже если авторов не найдено и map вернул float64)
+full_info = authors_relations.assign(
+    preferreddisplayname=authors_relations['constituentid'].map(name_by_cid).astype(name_by_cid.dtype),
+    title=authors_relations['objectid'].map(objects_by_oid['title']).astype(objects_by_oid['title'].dtype),
+    displaydate=authors_relations['objectid'].map(objects_by_oid['displaydate']).astype(
+        objects_by_oid['displaydate'].dtype
+    ),
+).dropna(subset=['preferreddisplayname'])
+
+# Объединяем с изображениями для получения uuid (у объекта может быть несколько изображений)
 full_info = full_info.merge(
     downloaded_images[['depictstmsobjectid', 'uuid']], 
     left_on='objectid', 
@@ -57,20 +62,32 @@ print("\n" + "="*80)
 print("АНАЛИЗ ДАТАСЕТА")
 print("="*80)
 
-# Группировка по авторам
-by_author = full_info.groupby('preferreddisplayname').size().reset_index(name='count')
+# Группировка по авторам: число изображений считаем по целочисленным ключам,
+# а имена подставляем только к итоговым суммам
+images_per_object = downloaded_images['depictstmsobjectid'].value_counts()
+by_cid = authors_relations['objectid'].map(images_per_object).groupby(
+    authors_relations['constituentid'], sort=False
+).sum()
+by_author = (
+    by_cid.groupby(by_cid.index.map(name_by_cid)).sum()
+    .rename_axis('preferreddisplayname')
+    .reset_index(name='count')
+)
 print("\nРаспределение по авторам:")
-for _, row in by_author.iterrows():
-    print(f"  {row['preferreddisplayname']}: {row['count']} изображений")
+print("\n".join(f"  {name}: {count} изображений" for name, count in by_author.itertuples(index=False)))
 
 # Детальная информация по каждому автору
 print("\n" + "="*80)
-for author in by_author['preferreddisplayname'].unique():
-    print(f"\n{author.upper()}")
-    print("-"*80)
-    author_works = full_info[full_info['preferreddisplayname'] == author]
-    for _, work in author_works.iterrows():
-        print(f"  • {work['uuid']}.jpg - {work['title']} ({work['displaydate']})")
+full_info['line'] = (
+    '  • ' + full_info['uuid'] + '.jpg - ' + full_info['title'].fillna('') +
+    ' (' + full_info['displaydate'].fillna('') + ')'
+)
+full_info['list_line'] = full_info['uuid'] + '.jpg\n'
+works_by_author = full_info.groupby('preferreddisplayname')
+blocks = works_by_author['line'].apply('\n'.join)
+sys.stdout.write(''.join(
+    f"\n{author.upper()}\n{'-'*80}\n{lines}\n" for author, lines in blocks.items()
+))
 
 # Сохраняем информацию в CSV
 output_file = "./NGA_Dataset/dataset_info.csv"
@@ -81,17 +98,16 @@ full_info[['uuid', 'preferreddisplayname', 'title', 'displaydate']].to_csv(
 print(f"\n\nИнформация сохранена в {output_file}")
 
 # Создаём файлы со списками для каждого автора
-for author in by_author['preferreddisplayname'].unique():
-    author_works = full_info[full_info['preferreddisplayname'] == author]
-    author_uuids = author_works['uuid'].tolist()
-    
-    # Безопасное имя файла
-    safe_name = author.replace(' ', '_').replace(',', '')
+payloads = works_by_author['list_line'].apply(''.join)
+
+# Безопасные имена файлов для всех авторов сразу
+safe_names = payloads.index.str.replace(' ', '_', regex=False).str.replace(',', '', regex=False)
+
+for author, safe_name, payload in zip(payloads.index, safe_names, payloads):
     list_file = f"./NGA_Dataset/{safe_name}_images.txt"
     
-    with open(list_file, 'w') as f:
-        for uuid in author_uuids:
-            f.write(f"{uuid}.jpg\n")
+    with open(list_file, 'w', buffering=1 << 20) as f:
+        f.write(payload)
     
     print(f"Список для {author}: {list_file}")
 
@@ -1,79 +1,112 @@
-import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from threading import Lock
+import csv
+import shutil
+import argparse
+import contextlib
+import logging
+import logging.handlers
+import queue
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+
+from nga_data import SCHEMAS, artist_rows, contains_any, load_table
 
 DEFAULT_SAVE_FOLDER = os.path.join(os.getcwd(), "NGA_Dataset")
 os.makedirs(DEFAULT_SAVE_FOLDER, exist_ok=True)
 log_file = os.path.join(DEFAULT_SAVE_FOLDER, "download_log.txt")
 description_file = os.path.join(DEFAULT_SAVE_FOLDER, "description.csv")
-log_lock = Lock()  # To prevent race conditions in logging
-description_lock = Lock()  # To prevent race conditions in description writing
 
-# Logging function (thread-safe)
-def write_log(message):
-    with log_lock:
-        with open(log_file, "a") as log:
-            log.write(message + "\n")
+# Shared HTTP session: keep-alive connections reused across download threads
+SESSION = requests.Session()
+adapter = HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=32,
+    max_retries=Retry(total=3, status_forcelist=[502, 503, 504], backoff_factor=0.3),
+)
+SESSION.mount("https://", adapter)
+SESSION.mount("http://", adapter)
 
-# Description writing function (thread-safe)
-def write_description(description_data):
-    """
-    Записывает описание изображения в CSV файл.
-    description_data: словарь с полями uuid, filename, artist, title, date, classification, medium
-    """
-    with description_lock:
-        # Проверяем, существует ли файл
-        file_exists = os.path.exists(description_file)
-        
-        # Создаём DataFrame из одной записи
-        df = pd.DataFrame([description_data])
-        
-        # Записываем в файл (добавляем заголовок только если файл новый)
-        df.to_csv(description_file, mode='a', header=not file_exists, index=False)
+# Columns of description.csv
+DESCRIPTION_FIELDS = ["uuid", "filename", "artist", "title", "date", "classification", "medium"]
+DESCRIPTION_FLUSH_ROWS = 1024  # Descriptions are written in batches of this size
 
-# Download function (run in parallel)
-def download_image(row):
-    base_url = row["iiifurl"]
-    uuid = row["uuid"]
-    image_url = f"{base_url}/full/full/360/default.jpg" # few images are partially returned if 360 is replaced with a zero
-    file_name = f"{uuid}.jpg"
-    file_path = os.path.join(DEFAULT_SAVE_FOLDER, file_name)
+# Fallbacks for missing metadata in description.csv
+DESCRIPTION_DEFAULTS = {
+    "artist": "Unknown",
+    "title": "Untitled",
+    "date": "Unknown",
+    "classification": "Unknown",
+    "medium": "Unknown",
+}
 
-    try:
-        response = requests.get(image_url, stream=True, timeout=15)
+# Columns passed to download_image for each record: description fields plus download targets
+RECORD_COLUMNS = DESCRIPTION_FIELDS + ["image_url", "file_path"]
+
+# Logging: threads only enqueue records, a QueueListener thread writes them to log_file
+log_queue = queue.Queue(-1)
+logger = logging.getLogger("nga")
+logger.setLevel(logging.INFO)
+logger.propagate = False
+logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
+# Download function (run in parallel), row is a dict record with RECORD_COLUMNS.
+# Returns the row itself for description.csv, or None if there is nothing to record
+def download_image(row, force=False, recorded_uuids=frozenset()):
+    image_url = row["image_url"]
+    file_name = row["filename"]
+    file_path = row["file_path"]
+    part_path = file_path + ".part"
+
+    # Already downloaded in a previous session: no HTTP request needed
+    if not force and os.path.exists(file_path) and os.path.getsize(file_path) > 0:
+        logger.info(f"SKIPPED (exists): {file_name}")
+    else:
+        try:
+            # Closing the response returns its connection to the session pool
+            with SESSION.get(image_url, stream=True, timeout=15) as response:
+                if response.status_code != 200:
+                    print(f"FAILED (HTTP {response.status_code}): {file_name}")
+                    logger.info(f"FAILURE (HTTP {response.status_code}): {file_name} | URL: {image_url}")
+                    return None
 
-        if response.status_code == 200:
-            with open(file_path, "wb") as file:
-                for chunk in response.iter_content(1024):
-                    if chunk:
-                        file.write(chunk)
+                # Write to a temporary file so an interrupted download never looks finished
+                response.raw.decode_content = True
+                with open(part_path, "wb") as file:
+                    shutil.copyfileobj(response.raw, file, length=1 << 16)
+                os.replace(part_path, file_path)
             print(f"Downloaded: {file_name}")
-            write_log(f"SUCCESS: {file_name} | URL: {image_url}")
-            
-            # Сохраняем описание картины
-            description_data = {
-                'uuid': uuid,
-                'filename': file_name,
-                'artist': row.get('artist', 'Unknown'),
-                'title': row.get('title', 'Untitled'),
-                'date': row.get('displaydate', 'Unknown'),
-                'classification': row.get('classification', 'Unknown'),
-                'medium': row.get('medium', 'Unknown')
-            }
-            write_description(description_data)
-            
-        else:
-            print(f"FAILED (HTTP {response.status_code}): {file_name}")
-            write_log(f"FAILURE (HTTP {response.status_code}): {file_name} | URL: {image_url}")
+            logger.info(f"SUCCESS: {file_name} | URL: {image_url}")
+
+        except Exception as e:
+            print(f"ERROR: {file_name} | {e}")
+            logger.info(f"ERROR: {file_name} | URL: {image_url} | Exception: {e}")
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(part_path)
+            return None
 
-    except Exception as e:
-        print(f"ERROR: {file_name} | {e}")
-        write_log(f"ERROR: {file_name} | URL: {image_url} | Exception: {e}")
+    # Описание картины, если его ещё нет в description.csv
+    if row["uuid"] in recorded_uuids:
+        return None
+    return row
+
+# Bounded submission: at most max_in_flight tasks are queued at any time.
+# Yields task results in completion order
+def run_bounded(executor, fn, items, max_in_flight):
+    in_flight = set()
+    for item in items:
+        if len(in_flight) >= max_in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+        in_flight.add(executor.submit(fn, item))
+    for future in wait(in_flight).done:
+        yield future.result()
 
 def filter_by_classification(images_df, objects_path, allowed_classifications=None, 
-                            excluded_subclassifications=None):
+                            excluded_subclassifications=None, objects_df=None):
     """
     Фильтрует изображения по классификации объектов (исключает наброски и другие типы).
     
@@ -82,13 +115,16 @@ def filter_by_classification(images_df, objects_path, allowed_classifications=No
         objects_path: путь к файлу objects.csv
         allowed_classifications: список разрешённых классификаций (None = все разрешены)
         excluded_subclassifications: список исключённых подклассификаций (например, наброски)
+        objects_df: уже загруженный objects.csv (опционально, иначе читается из objects_path)
     
     Returns:
         Отфильтрованный DataFrame с изображениями
     """
     # Загружаем данные об объектах
-    print("\nЗагрузка данных об объектах...")
-    objects = pd.read_csv(objects_path, low_memory=False)
+    if objects_df is None:
+        print("\nЗагрузка данных об объектах...")
+        objects_df = load_table(objects_path, **SCHEMAS["objects"])
+    objects = objects_df
     
     # Фильтруем по классификации
     if allowed_classifications:
@@ -104,16 +140,14 @@ def filter_by_classification(images_df, objects_path, allowed_classifications=No
         print(f"Исключено объектов: {before_count - len(objects)}")
         print(f"Объектов после фильтрации: {len(objects)}")
     
-    # Получаем ID объектов
-    object_ids = objects['objectid'].unique()
-    
-    # Фильтруем изображения по объектам
-    filtered_images = images_df[images_df['depictstmsobjectid'].isin(object_ids)]
+    # Фильтруем изображения по объектам (objectid уникален в objects.csv)
+    filtered_images = images_df[images_df['depictstmsobjectid'].isin(objects['objectid'])]
     print(f"\nНайдено изображений после фильтрации: {len(filtered_images)}")
     
     return filtered_images
 
-def filter_by_artists(images_df, constituents_path, objects_constituents_path, artist_names):
+def filter_by_artists(images_df, constituents_path, objects_constituents_path, artist_names,
+                      constituents_df=None, artist_relations_df=None):
     """
     Фильтрует изображения по списку имён авторов.
     
@@ -122,19 +156,25 @@ def filter_by_artists(images_df, constituents_path, objects_constituents_path, a
         constituents_path: путь к файлу constituents.csv
         objects_constituents_path: путь к файлу objects_constituents.csv
         artist_names: список имён авторов для фильтрации (можно использовать частичные совпадения)
+        constituents_df: уже загруженный constituents.csv (опционально)
+        artist_relations_df: уже выбранные связи с ролью artist, см. artist_rows (опционально)
     
     Returns:
         Отфильтрованный DataFrame с изображениями только указанных авторов
     """
     # Загружаем данные об авторах
-    constituents = pd.read_csv(constituents_path)
-    objects_constituents = pd.read_csv(objects_constituents_path)
+    constituents = constituents_df
+    if constituents is None:
+        constituents = load_table(constituents_path, **SCHEMAS["constituents"])
+    artist_relations = artist_relations_df
+    if artist_relations is None:
+        artist_relations = artist_rows(
+            load_table(objects_constituents_path, **SCHEMAS["objects_constituents"])
+        )
     
     # Фильтруем авторов по именам (поиск по частичному совпадению)
     if artist_names:
-        artist_filter = constituents['preferreddisplayname'].str.contains(
-            '|'.join(artist_names), case=False, na=False
-        )
+        artist_filter = contains_any(constituents['preferreddisplayname'], artist_names)
         selected_constituents = constituents[artist_filter]
         
         print(f"\nНайдено авторов: {len(selected_constituents)}")
@@ -146,13 +186,10 @@ def filter_by_artists(images_df, constituents_path, objects_constituents_path, a
         constituent_ids = selected_constituents['constituentid'].tolist()
         
         # Находим объекты этих авторов (только когда они являются создателями)
-        artist_objects = objects_constituents[
-            (objects_constituents['constituentid'].isin(constituent_ids)) &
-            (objects_constituents['roletype'] == 'artist')
-        ]
+        artist_objects = artist_relations[artist_relations['constituentid'].isin(constituent_ids)]
         
         # Получаем ID объектов
-        object_ids = artist_objects['objectid'].unique()
+        object_ids = frozenset(artist_objects['objectid'].tolist())
         print(f"Найдено объектов: {len(object_ids)}")
         
         # Фильтруем изображения по объектам
@@ -167,7 +204,7 @@ def filter_by_artists(images_df, constituents_path, objects_constituents_path, a
 def download_dataset(images_path, max_threads=8, artist_names=None, 
                     constituents_path=None, objects_constituents_path=None,
                     objects_path=None, allowed_classifications=None,
-                    excluded_subclassifications=None):
+                    excluded_subclassifications=None, force=False):
     """
     Скачивает изображения из датасета.
     
@@ -180,37 +217,65 @@ def download_dataset(images_path, max_threads=8, artist_names=None,
         objects_path: путь к objects.csv (опционально, нужен для фильтрации по классификации)
         allowed_classifications: список разрешённых классификаций (опционально)
         excluded_subclassifications: список исключённых подклассификаций (опционально)
+        force: скачать заново все изображения и пересоздать description.csv
     """
-    # Удаляем старый description.csv перед началом новой сессии
+    # С force удаляем старый description.csv, иначе дописываем только новые описания
+    recorded_uuids = frozenset()
     if os.path.exists(description_file):
-        os.remove(description_file)
-        print(f"Удалён старый файл {description_file}")
+        if force:
+            os.remove(description_file)
+            print(f"Удалён старый файл {description_file}")
+        else:
+            with open(description_file, newline="") as description:
+                recorded_uuids = frozenset(r['uuid'] for r in csv.DictReader(description))
+            print(f"Уже описано изображений: {len(recorded_uuids)}")
     
-    data = pd.read_csv(images_path)
+    data = load_table(images_path, **SCHEMAS["images"])
     data = data.dropna(subset=["iiifurl"])
     
+    # Каждую таблицу читаем один раз: она нужна и для фильтрации, и для метаданных
+    objects = None
+    if objects_path:
+        print("\nЗагрузка данных об объектах...")
+        objects = load_table(objects_path, **SCHEMAS["objects"])
+    constituents = artist_relations = None
+    if constituents_path and objects_constituents_path:
+        constituents = load_table(constituents_path, **SCHEMAS["constituents"])
+        # Связи с ролью artist выбираем один раз для фильтрации и для имён авторов
+        artist_relations = artist_rows(
+            load_table(objects_constituents_path, **SCHEMAS["objects_constituents"])
+        )
+    
     # Фильтрация по классификации, если указаны параметры
     if objects_path and (allowed_classifications or excluded_subclassifications):
         data = filter_by_classification(data, objects_path, allowed_classifications, 
-                                       excluded_subclassifications)
+                                       excluded_subclassifications, objects_df=objects)
         if len(data) == 0:
             print("Не найдено изображений после фильтрации по классификации!")
             return
     
     # Фильтрация по авторам, если указаны
     if artist_names and constituents_path and objects_constituents_path:
-        data = filter_by_artists(data, constituents_path, objects_constituents_path, artist_names)
+        data = filter_by_artists(data, constituents_path, objects_constituents_path, artist_names,
+                                 constituents_df=constituents,
+                                 artist_relations_df=artist_relations)
         if len(data) == 0:
             print("Не найдено изображений для указанных авторов!")
             return
     
+    # ID объектов оставшихся изображений: по ним сужаем таблицы до объединения
+    object_ids = frozenset(data['depictstmsobjectid'].dropna().tolist())
+    
     # Добавляем информацию об объектах к данным изображений
     if objects_path:
         print("\nДобавление метаданных объектов...")
-        objects = pd.read_csv(objects_path, low_memory=False)
+        objects = objects.loc[
+            objects['objectid'].isin(object_ids),
+            ['objectid', 'title', 'displaydate', 'classification', 'medium']
+        ]
         # Объединяем данные изображений с данными объектов
         data = data.merge(
-            objects[['objectid', 'title', 'displaydate', 'classification', 'medium']], 
+            objects, 
             left_on='depictstmsobjectid', 
             right_on='objectid', 
             how='left'
@@ -219,43 +284,90 @@ def download_dataset(images_path, max_threads=8, artist_names=None,
     # Добавляем информацию об авторах
     if constituents_path and objects_constituents_path:
         print("Добавление информации об авторах...")
-        constituents = pd.read_csv(constituents_path)
-        objects_constituents = pd.read_csv(objects_constituents_path)
         
         # Получаем авторов для каждого объекта
-        artists = objects_constituents[objects_constituents['roletype'] == 'artist'].merge(
-            constituents[['constituentid', 'preferreddisplayname']], 
-            on='constituentid'
-        )
+        object_artists = artist_relations[artist_relations['objectid'].isin(object_ids)]
+        constituents = constituents.loc[
+            constituents['constituentid'].isin(object_artists['constituentid']),
+            ['constituentid', 'preferreddisplayname']
+        ]
+        artists = object_artists.merge(constituents, on='constituentid')
         
         # Группируем по objectid и объединяем имена авторов
-        artists_grouped = artists.groupby('objectid')['preferreddisplayname'].apply(
-            lambda x: ', '.join(x)
-        ).reset_index()
-        artists_grouped.columns = ['objectid', 'artist']
+        artists_grouped = (
+            artists.groupby('objectid', sort=False)['preferreddisplayname']
+            .agg(', '.join)
+            .rename('artist')
+            .reset_index()
+        )
         
         # Добавляем к данным
         data = data.merge(artists_grouped, left_on='depictstmsobjectid', right_on='objectid', how='left')
 
-    write_log("=" * 60)
-    write_log("New Download Session Started")
-    if artist_names:
-        write_log(f"Filtering by artists: {', '.join(artist_names)}")
-    if allowed_classifications:
-        write_log(f"Allowed classifications: {', '.join(allowed_classifications)}")
-    if excluded_subclassifications:
-        write_log(f"Excluded subclassifications: {', '.join(excluded_subclassifications)}")
-    write_log("=" * 60)
+    file_handler = logging.FileHandler(log_file)
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    try:
+        listener.start()
+
+        logger.info("=" * 60)
+        logger.info("New Download Session Started")
+        if artist_names:
+            logger.info(f"Filtering by artists: {', '.join(artist_names)}")
+        if allowed_classifications:
+            logger.info(f"Allowed classifications: {', '.join(allowed_classifications)}")
+        if excluded_subclassifications:
+            logger.info(f"Excluded subclassifications: {', '.join(excluded_subclassifications)}")
+        logger.info("=" * 60)
 
-    with ThreadPoolExecutor(max_workers=max_threads) as executor:
-        futures = [executor.submit(download_image, row) for _, row in data.iterrows()]
-        for future in as_completed(futures):
-            pass  # We don't need to gather results, everything is logged inside threads
+        # Имена файлов, пути и URL считаются векторно для всех записей сразу
+        data = data.rename(columns={'displaydate': 'date'})
+        data['filename'] = data['uuid'] + '.jpg'
+        data['file_path'] = DEFAULT_SAVE_FOLDER + os.sep + data['filename']
+        data['image_url'] = data['iiifurl'] + '/full/full/360/default.jpg' # few images are partially returned if 360 is replaced with a zero
+        # Отсутствующие колонки, пропуски и пустые строки заменяем значениями по умолчанию
+        records = data.reindex(columns=RECORD_COLUMNS).astype(object)
+        records = records.mask(records.isin([''])).fillna(DESCRIPTION_DEFAULTS)
+        # Записи создаются лениво, по мере освобождения слотов в пуле
+        columns = list(records.columns)
+        records = (dict(zip(columns, values)) for values in records.itertuples(index=False, name=None))
+
+        worker = partial(download_image, force=force, recorded_uuids=recorded_uuids)
+
+        # Описания собираются из результатов потоков и пишутся пачками из основного потока
+        # Заголовок нужен и для нового, и для пустого файла (например, после прерванной сессии)
+        write_header = not os.path.exists(description_file) or os.path.getsize(description_file) == 0
+        with open(description_file, "a", newline="") as description:
+            description_writer = csv.DictWriter(
+                description, fieldnames=DESCRIPTION_FIELDS, extrasaction="ignore"
+            )
+            if write_header:
+                description_writer.writeheader()
+
+            pending = []
+            try:
+                with ThreadPoolExecutor(max_workers=max_threads) as executor:
+                    for result in run_bounded(executor, worker, records, max_in_flight=2 * max_threads):
+                        if result is None:
+                            continue
+                        pending.append(result)
+                        if len(pending) >= DESCRIPTION_FLUSH_ROWS:
+                            description_writer.writerows(pending)
+                            pending.clear()
+            finally:
+                description_writer.writerows(pending)
+    finally:
+        listener.stop()  # Flushes queued log records
+        file_handler.close()
 
     print("Download complete!")
     print(f"\nОписания сохранены в {description_file}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NGA Image Downloader")
+    parser.add_argument("--force", action="store_true",
+                        help="re-download all images and recreate description.csv")
+    args = parser.parse_args()
+
     print("=" * 60)
     print("NGA Image Downloader")
     print("=" * 60)
@@ -340,5 +452,6 @@ if __name__ == "__main__":
         objects_constituents_path=objects_constituents_path,
         objects_path=objects_path,
         allowed_classifications=allowed_classifications,
-        excluded_subclassifications=excluded_subclassifications
+        excluded_subclassifications=excluded_subclassifications,
+        force=args.force
     )
\ No newline at end of file
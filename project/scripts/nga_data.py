@@ -0,0 +1,143 @@
+"""
+Общие функции загрузки CSV-таблиц датасета NGA
+"""
+
+import os
+import re
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.feather as feather
+
+# Версия формата Feather-кэша: увеличивается при изменении параметров разбора CSV,
+# чтобы старые кэши пересоздавались
+SIDECAR_VERSION = 3
+
+# Нужные колонки с явными типами разбора (текст всегда string, ID как int32)
+# и приведения после загрузки (повторяющиеся строки как category)
+SCHEMAS = {
+    "images": {
+        "column_types": {
+            "uuid": pa.string(),
+            "iiifurl": pa.string(),
+            "depictstmsobjectid": pa.int32(),
+        },
+    },
+    "objects": {
+        "column_types": {
+            "objectid": pa.int32(),
+            "title": pa.string(),
+            "displaydate": pa.string(),
+            "classification": pa.string(),
+            "subclassification": pa.string(),
+            "medium": pa.string(),
+        },
+        "dtype": {"classification": "category", "subclassification": "category"},
+    },
+    "constituents": {
+        "column_types": {
+            "constituentid": pa.int32(),
+            "preferreddisplayname": pa.string(),
+            "artistofngaobject": pa.int8(),
+            "displaydate": pa.string(),
+            "nationality": pa.string(),
+        },
+        "dtype": {"nationality": "category"},
+    },
+    "objects_constituents": {
+        "column_types": {
+            "objectid": pa.int32(),
+            "constituentid": pa.int32(),
+            "roletype": pa.string(),
+        },
+        "dtype": {"roletype": "category"},
+    },
+}
+
+
+def _sidecar_has_columns(sidecar, columns):
+    """Проверяет, что Feather-кэш содержит все нужные колонки."""
+    schema = pa.ipc.open_file(sidecar).schema
+    return columns is None or set(columns) <= set(schema.names)
+
+
+def load_table(path, columns=None, dtype=None, column_types=None):
+    """
+    Загружает CSV-таблицу через pyarrow с кэшированием в Feather-файл.
+
+    При первом чтении CSV разбирается многопоточно (только нужные колонки)
+    и сохраняется рядом в `<path>.v<SIDECAR_VERSION>.feather`; последующие
+    запуски читают только Feather. Кэш пересоздаётся, если CSV новее него
+    или в нём нет нужных колонок. Пустые ячейки загружаются как пропуски
+    (null), как и в pd.read_csv.
+
+    Args:
+        path: путь к CSV файлу
+        columns: список нужных колонок (None = колонки из column_types или все)
+        dtype: словарь {колонка: тип} для приведения после загрузки
+        column_types: словарь {колонка: тип pyarrow} для разбора CSV без угадывания типов
+
+    Returns:
+        DataFrame с колонками на базе Arrow
+    """
+    if columns is None and column_types:
+        columns = list(column_types)
+    sidecar = f"{path}.v{SIDECAR_VERSION}.feather"
+
+    if (os.path.exists(sidecar) and os.path.getmtime(sidecar) >= os.path.getmtime(path)
+            and _sidecar_has_columns(sidecar, columns)):
+        table = feather.read_table(sidecar, columns=columns)
+    else:
+        table = pa_csv.read_csv(
+            path,
+            parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=columns,
+                column_types=column_types,
+                strings_can_be_null=True,
+            ),
+        )
+        feather.write_feather(table, sidecar, compression="zstd")
+
+    df = table.to_pandas(types_mapper=pd.ArrowDtype)
+    if dtype:
+        df = df.astype(dtype)
+    return df
+
+
+def artist_rows(objects_constituents):
+    """
+    Выбирает связи объект–автор с ролью artist.
+
+    roletype загружается как category, поэтому сравнение идёт по кодам,
+    а не по строкам. Результат стоит вычислить один раз и переиспользовать.
+
+    Args:
+        objects_constituents: DataFrame из objects_constituents.csv
+
+    Returns:
+        DataFrame с колонками objectid, constituentid
+    """
+    return objects_constituents.loc[
+        objects_constituents['roletype'] == 'artist', ['objectid', 'constituentid']
+    ]
+
+
+def contains_any(series, substrings):
+    """
+    Проверяет, содержит ли строка хотя бы одну из подстрок (без учёта регистра).
+
+    Сопоставление выполняется одним проходом Arrow-ядра по всей колонке.
+
+    Args:
+        series: строковая колонка DataFrame
+        substrings: список искомых подстрок
+
+    Returns:
+        Булев numpy-массив (пропуски дают False)
+    """
+    pattern = '|'.join(re.escape(s) for s in substrings)
+    mask = pc.match_substring_regex(pa.array(series), pattern, ignore_case=True)
+    return pc.fill_null(mask, False).to_numpy(zero_copy_only=False)
@@ -5,10 +5,35 @@
 import pandas as pd
 import os
 
+from nga_data import SCHEMAS, artist_rows, contains_any, load_table
+
 DATA_DIR = "./3rd_party/opendata/data"
 CONSTITUENTS_PATH = os.path.join(DATA_DIR, "constituents.csv")
 OBJECTS_CONSTITUENTS_PATH = os.path.join(DATA_DIR, "objects_constituents.csv")
 
+def works_per_constituent(objects_constituents_path=OBJECTS_CONSTITUENTS_PATH):
+    """
+    Количество работ каждого автора с кэшированием в Feather-файл
+    
+    Кэш `<path>.works.feather` пересчитывается, если CSV новее него.
+    
+    Args:
+        objects_constituents_path: путь к objects_constituents.csv
+    
+    Returns:
+        Series works_count с индексом constituentid
+    """
+    cache = objects_constituents_path + ".works.feather"
+    if os.path.exists(cache) and os.path.getmtime(cache) >= os.path.getmtime(objects_constituents_path):
+        return pd.read_feather(cache, dtype_backend="pyarrow").set_index('constituentid')['works_count']
+    
+    objects_constituents = load_table(objects_constituents_path, **SCHEMAS["objects_constituents"])
+    works_count = artist_rows(objects_constituents).groupby(
+        'constituentid', sort=False
+    ).size().rename('works_count')
+    works_count.reset_index().to_feather(cache)
+    return works_count
+
 def search_artists(search_term="", show_stats=True):
     """
     Поиск авторов в датасете
@@ -18,16 +43,14 @@ def search_artists(search_term="", show_stats=True):
         show_stats: показывать статистику по количеству работ
     """
     # Загружаем данные
-    constituents = pd.read_csv(CONSTITUENTS_PATH)
+    constituents = load_table(CONSTITUENTS_PATH, **SCHEMAS["constituents"])
     
     # Фильтруем только художников
     artists = constituents[constituents['artistofngaobject'] == 1].copy()
     
     # Поиск по имени
     if search_term:
-        mask = artists['preferreddisplayname'].str.contains(
-            search_term, case=False, na=False
-        )
+        mask = contains_any(artists['preferreddisplayname'], [search_term])
         artists = artists[mask]
     
     if len(artists) == 0:
@@ -36,21 +59,9 @@ def search_artists(search_term="", show_stats=True):
     
     # Если нужна статистика
     if show_stats:
-        objects_constituents = pd.read_csv(OBJECTS_CONSTITUENTS_PATH)
-        
-        # Подсчитываем количество работ для каждого автора
-        artist_works = objects_constituents[
-            objects_constituents['roletype'] == 'artist'
-        ].groupby('constituentid').size().reset_index(name='works_count')
-        
-        # Объединяем с информацией об авторах
-        artists = artists.merge(
-            artist_works, 
-            left_on='constituentid', 
-            right_on='constituentid',
-            how='left'
-        )
-        artists['works_count'] = artists['works_count'].fillna(0).astype(int)
+        # Количество работ для каждого автора
+        works_count = works_per_constituent()
+        artists['works_count'] = artists['constituentid'].map(works_count).fillna(0).astype(int)
         
         # Сортируем по количеству работ
         artists = artists.sort_values('works_count', ascending=False)
@@ -79,13 +90,10 @@ def list_top_artists(top_n=20):
     Args:
         top_n: количество авторов для отображения
     """
-    constituents = pd.read_csv(CONSTITUENTS_PATH)
-    objects_constituents = pd.read_csv(OBJECTS_CONSTITUENTS_PATH)
+    constituents = load_table(CONSTITUENTS_PATH, **SCHEMAS["constituents"])
     
     # Подсчитываем работы
-    artist_works = objects_constituents[
-        objects_constituents['roletype'] == 'artist'
-    ].groupby('constituentid').size().reset_index(name='works_count')
+    artist_works = works_per_constituent().reset_index()
     
     # Объединяем с именами
     artists = constituents.merge(artist_works, on='constituentid')